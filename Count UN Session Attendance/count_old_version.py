@@ -1,24 +1,29 @@
 import os
 import re
-from agentic_doc.parse import parse
-from dotenv import load_dotenv, find_dotenv
+import asyncio
+import openai
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pydantic import BaseModel, Field
 from typing import List, Optional
-import pandas as pd
 
 from langchain_openai import ChatOpenAI
 from langchain_core.utils.function_calling import convert_to_openai_function
 from langchain.output_parsers.openai_functions import JsonKeyOutputFunctionsParser
 from langchain_core.prompts.chat import HumanMessagePromptTemplate, ChatPromptTemplate
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_exponential
 
-# === Load API key ===
-_ = load_dotenv(find_dotenv())
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY is not set.")
+from llm_cache import llm_cache, cached_llm
+from utils import has_delegation_content, create_async_http_client, export_to_excel
+from delegates_core import (OPENAI_API_KEY, MAX_CONCURRENT_REQUESTS, split_request_budget, get_year_from_filename,
+                            extract_text_from_pdf, split_text_by_country, extract_sessions_async,
+                            save_results)
 
-# === LangChain model ===
-model = ChatOpenAI(model="gpt-4o", temperature=0, api_key=OPENAI_API_KEY)
+# === LangChain model settings (the model itself is built per worker, see build_extraction_chain) ===
+MODEL_NAME = "gpt-4o"
+TEMPERATURE = 0
+
+_WHITESPACE_RE = re.compile(r'\s+')
 
 # === Pydantic schemas ===
 class DelegationSession(BaseModel):
@@ -53,89 +58,96 @@ prompt_template = HumanMessagePromptTemplate.from_template(
 # === Build Chain ===
 prompt = ChatPromptTemplate.from_messages([prompt_template])
 functions = [convert_to_openai_function(DelegationData)]
-gpt_func_model = model.bind(functions=functions, function_call={"name": "DelegationData"})
-extraction_chain = prompt | gpt_func_model | JsonKeyOutputFunctionsParser(key_name="sessions")
 
-# === Extract text from PDF using agentic_doc.parse ===
-def extract_text_from_pdf(pdf_path):
-    results = parse(pdf_path)
-    full_text = ""
-    for res in results:
-        full_text += "\n" + res.markdown
-    return full_text
+# Built inside each worker process / event loop so the OpenAI client is never pickled or shared
+def build_extraction_chain(http_client):
+    model = ChatOpenAI(
+        model=MODEL_NAME,
+        temperature=TEMPERATURE,
+        api_key=OPENAI_API_KEY,
+        http_async_client=http_client,
+    )
+    gpt_func_model = model.bind(functions=functions, function_call={"name": "DelegationData"})
+    return prompt | gpt_func_model | JsonKeyOutputFunctionsParser(key_name="sessions")
 
 # === Normalize country name helper ===
 def normalize_country_name(name: str) -> str:
-    return re.sub(r'\s+', ' ', name.strip()).upper()
-
-# === Split text by country headings (robust to trailing HTML comments) ===
-def split_text_by_country(text):
-    chunks = []
-    current_country = None
-    current_text_lines = []
-
-    for line in text.splitlines():
-        line = line.strip()
-        if not line:
-            continue
-        line_clean = re.split(r'<!--', line)[0].strip()
-
-        if re.match(r'^[A-Z][A-Z\s\-&,\'\.]*$', line_clean):
-            print(f"Detected country heading: {line_clean}")  # <-- debug here
-            if current_country:
-                chunks.append((current_country, "\n".join(current_text_lines)))
-            current_country = line_clean
-            current_text_lines = []
-        else:
-            current_text_lines.append(line)
-
-    if current_country and current_text_lines:
-        chunks.append((current_country, "\n".join(current_text_lines)))
-
-    return chunks
-
-# === Year from filename ===
-def get_year_from_filename(filename):
-    m = re.search(r'(\d{4})', filename)
-    return m.group(1) if m else "NA"
-
-# === Extract sessions from text chunks with GPT chain ===
-def extract_sessions_from_text_chunks(chunks, year="NA"):
+    return _WHITESPACE_RE.sub(' ', name.strip()).upper()
+
+# === Empty session used when GPT returns nothing or fails ===
+def empty_session(country, year):
+    return {
+        "country": country, "year": year, "officials": [], "representatives": [],
+        "alternate_representatives": [], "advisers": [], "leader_present": False
+    }
+
+# === Invoke the GPT chain, backing off exponentially on rate limits ===
+async def invoke_chain_with_retry(extraction_chain, country, text):
+    async for attempt in AsyncRetrying(
+        retry=retry_if_exception_type(openai.RateLimitError),
+        wait=wait_exponential(multiplier=1, min=1, max=60),
+        stop=stop_after_attempt(6),
+        reraise=True,
+    ):
+        with attempt:
+            return await extraction_chain.ainvoke({"country": country, "text": text})
+
+# === Cached chain call: the rendered prompt + model settings form the cache key ===
+@cached_llm(llm_cache)
+async def run_extraction_chain(extraction_chain, *, model_name, temperature, functions, messages, country, text):
+    return await invoke_chain_with_retry(extraction_chain, country, text)
+
+# === Extract sessions from text chunks with GPT chain (concurrently) ===
+async def extract_sessions_from_text_chunks(chunks, year="NA", max_concurrent=MAX_CONCURRENT_REQUESTS):
+    sem = asyncio.Semaphore(max_concurrent)
+
+    async def extract_one(n, country, text):
+        if not has_delegation_content(text):
+            print(f"⏭️ Skipping {country}: no delegation names in {len(text)} chars")
+            return [empty_session(country, year)]
+        async with sem:
+            print(f"\n[{n}] Processing country: {country} ({len(text)} chars)")
+            try:
+                result = await run_extraction_chain(
+                    extraction_chain,
+                    model_name=MODEL_NAME,
+                    temperature=TEMPERATURE,
+                    functions=functions,
+                    messages=prompt.format(country=country, text=text),
+                    country=country,
+                    text=text,
+                )
+            except Exception as e:
+                print(f"❌ Error extracting {country}: {e}")
+                return [empty_session(country, year)]
+        if not result:
+            print(f"⚠️ GPT returned empty for {country}")
+            result = [empty_session(country, year)]
+        for session in result:
+            session["year"] = year
+        return result
+
+    # The pooled HTTP client is closed before this event loop ends
+    async with create_async_http_client() as http_client:
+        extraction_chain = build_extraction_chain(http_client)
+        # Identical chunk texts are sent to GPT once and the result is reused
+        results = await extract_sessions_async(
+            chunks, extract_one, lambda result, country: [dict(session, country=country) for session in result])
+
     sessions = []
-    for i, (country, text) in enumerate(chunks):
-        print(f"\n[{i+1}/{len(chunks)}] Processing country: {country} ({len(text)} chars)")
-        try:
-            result = extraction_chain.invoke({"country": country, "text": text})
-            if not result:
-                print(f"⚠️ GPT returned empty for {country}")
-                result = [{
-                    "country": country, "year": year, "officials": [], "representatives": [],
-                    "alternate_representatives": [], "advisers": [], "leader_present": False
-                }]
-            for session in result:
-                session["year"] = year
-                sessions.append(session)
-        except Exception as e:
-            print(f"❌ Error extracting {country}: {e}")
-            sessions.append({
-                "country": country, "year": year, "officials": [], "representatives": [],
-                "alternate_representatives": [], "advisers": [], "leader_present": False
-            })
+    for result in results:
+        sessions.extend(result)
     return sessions
 
-# === Save all results to Excel ===
-# === Save all results to Excel ===
-def save_sessions_to_excel(sessions, filename=None):
-    folder = "excel_outputs"
-    os.makedirs(folder, exist_ok=True)
-
+# === Save all results to Parquet (export to Excel separately) ===
+def save_sessions_to_parquet(sessions, filename=None):
     years = [int(s["year"]) for s in sessions if s.get("year") and s["year"].isdigit()]
     start_year = min(years) if years else "NA"
     end_year = max(years) if years else "NA"
 
     if not filename:
-        filename = f"delegation_counts_{start_year}-{end_year}.xlsx"
-    full_path = os.path.join(folder, filename)
+        filename = f"delegation_counts_{start_year}-{end_year}.parquet"
+    full_path = os.path.join("excel_outputs", filename)
 
     rows = []
     for s in sessions:
@@ -144,7 +156,6 @@ def save_sessions_to_excel(sessions, filename=None):
         alternate_reps = s.get("alternate_representatives") or []
         advisers = s.get("advisers") or []
 
-        # Use the ORIGINAL working order
         rows.append({
             "country": s.get("country", "").title(),
             "year": s.get("year", ""),
@@ -153,31 +164,37 @@ def save_sessions_to_excel(sessions, filename=None):
             "alternate_representatives": len(alternate_reps),
             "advisers": len(advisers),
             "attendees": len(officials) + len(representatives) + len(alternate_reps) + len(advisers),
-            "leader_present": int(s.get("leader_present", False)),  # Keep in original position
+            "leader_present": int(s.get("leader_present", False)),
         })
 
-    df = pd.DataFrame(rows)
-    df = df.sort_values(by=["country", "year"])
-    
-    # NOW reorder the columns to your desired order
-    desired_column_order = [
-        "country", 
-        "year", 
-        "officials", 
-        "leader_present",  # Move to desired position
-        "representatives", 
-        "alternate_representatives", 
-        "advisers", 
+    save_results(rows, full_path, columns=[
+        "country",
+        "year",
+        "officials",
+        "leader_present",
+        "representatives",
+        "alternate_representatives",
+        "advisers",
         "attendees"
-    ]
-    
-    # Reorder columns safely
-    df = df[desired_column_order]
-    
-    df.to_excel(full_path, index=False)
-    print(f"✅ Excel saved to {full_path}")
+    ])
     return full_path
 
+# === Process one PDF end to end (top-level so ProcessPoolExecutor can pickle it) ===
+def process_one_pdf(path, max_concurrent=MAX_CONCURRENT_REQUESTS):
+    filename = os.path.basename(path)
+    year = get_year_from_filename(filename)
+    print(f"\n{'='*50}\n📂 Processing file: {filename} (Year: {year})")
+
+    text = extract_text_from_pdf(path)
+    if not text:
+        print(f"❌ Failed to extract text from {filename}")
+        return []
+
+    chunks = split_text_by_country(text)
+    print(f"✂️ Split text into {len(chunks)} country chunks")
+
+    return asyncio.run(extract_sessions_from_text_chunks(chunks, year, max_concurrent))
+
 # === Main process to handle all PDFs in folder ===
 def main():
     folder = "un"
@@ -188,29 +205,21 @@ def main():
     pdf_files = [f for f in os.listdir(folder) if f.lower().endswith(".pdf")]
     print(f"📄 Found {len(pdf_files)} PDF files")
 
+    # Each PDF is independent: parse + GPT extraction run in their own process
+    pdf_paths = [os.path.join(folder, f) for f in pdf_files]
     all_sessions = []
-
-    for i, filename in enumerate(pdf_files, 1):
-        path = os.path.join(folder, filename)
-        year = get_year_from_filename(filename)
-        print(f"\n{'='*50}\n📂 Processing file {i}/{len(pdf_files)}: {filename} (Year: {year})")
-
-        text = extract_text_from_pdf(path)
-        if not text:
-            print(f"❌ Failed to extract text from {filename}")
-            continue
-
-        chunks = split_text_by_country(text)
-        print(f"✂️ Split text into {len(chunks)} country chunks")
-
-        sessions = extract_sessions_from_text_chunks(chunks, year)
-        all_sessions.extend(sessions)
+    # Each worker gets its share of the OpenAI request budget
+    workers, per_worker = split_request_budget(len(pdf_paths))
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        for sessions in ex.map(process_one_pdf, pdf_paths, repeat(per_worker)):
+            all_sessions.extend(sessions)
 
     if not all_sessions:
         print("⚠️ No sessions extracted from any files.")
         return
 
-    save_sessions_to_excel(all_sessions)
+    parquet_path = save_sessions_to_parquet(all_sessions)
+    export_to_excel(parquet_path)
     print(f"\n✅ Done. Extracted data for {len(all_sessions)} sessions across {len(pdf_files)} files.")
 
 if __name__ == "__main__":
@@ -0,0 +1,122 @@
+import os
+import re
+import asyncio
+import hashlib
+import numpy as np
+import pandas as pd
+import openai
+from dotenv import load_dotenv, find_dotenv
+from agentic_doc.parse import parse
+
+from utils import split_text_by_country, text_key, create_async_http_client
+
+# === Load API key (shared by count_old_version.py and extract_delegates.py) ===
+load_dotenv(find_dotenv())
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+if not OPENAI_API_KEY:
+    raise ValueError("OPENAI_API_KEY is not set. Please set it in your .env file.")
+
+# Caches live next to the scripts so both entry points hit them from any working directory
+CACHE_ROOT = os.path.dirname(os.path.abspath(__file__))
+TEXT_CACHE_DIR = os.path.join(CACHE_ROOT, "text_cache")
+
+# Maximum number of OpenAI requests in flight at the same time
+MAX_CONCURRENT_REQUESTS = 20
+
+_YEAR_RE = re.compile(r'(\d{4})')
+
+# === Split the request budget across worker processes so the total in flight stays at MAX_CONCURRENT_REQUESTS ===
+def split_request_budget(n_jobs):
+    workers = max(1, min(os.cpu_count() or 1, n_jobs, MAX_CONCURRENT_REQUESTS))
+    return workers, MAX_CONCURRENT_REQUESTS // workers
+
+# === Async OpenAI client on a pooled HTTP/2 connection (one per event loop; await client.close() before the loop ends) ===
+def get_client():
+    return openai.AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=create_async_http_client())
+
+# === Year from filename ===
+def get_year_from_filename(filename, default="NA"):
+    m = _YEAR_RE.search(os.path.basename(filename))
+    return m.group(1) if m else default
+
+# === Hash PDF contents so edited PDFs never hit a stale text cache ===
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+# === Extract text from PDF using agentic_doc.parse (cached in text_cache/, keyed by content hash) ===
+def extract_text_from_pdf(pdf_path):
+    try:
+        os.makedirs(TEXT_CACHE_DIR, exist_ok=True)
+        stem = os.path.splitext(os.path.basename(pdf_path))[0]
+        cache_path = os.path.join(TEXT_CACHE_DIR, f"{stem}.{file_sha256(pdf_path)}.txt")
+    except Exception as e:
+        print(f"Error extracting text from {pdf_path}: {e}")
+        return ""
+
+    if os.path.exists(cache_path):
+        print(f"Loading cached text from {cache_path}")
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                return f.read()
+        except Exception as e:
+            print(f"Error reading cached text: {e}")
+
+    try:
+        print(f"Extracting text from {pdf_path}...")
+        results = parse(pdf_path)
+        full_text = "\n".join(getattr(res, "markdown", None) or getattr(res, "text", "") for res in results)
+    except Exception as e:
+        print(f"Error extracting text from {pdf_path}: {e}")
+        return ""
+
+    try:
+        with open(cache_path, "w", encoding="utf-8") as f:
+            f.write(full_text)
+        print(f"Text cached to {cache_path}")
+    except Exception as e:
+        print(f"Error saving text to cache: {e}")
+    return full_text
+
+# === Run extract_one(n, country, text) once per distinct chunk text, scheduling chunks as they arrive ===
+async def extract_sessions_async(chunks, extract_one, rename):
+    """Return one result per chunk, in chunk order; duplicate texts reuse rename(result, country)"""
+    countries = []
+    keys = []
+    tasks = {}
+    for country, text in chunks:
+        key = text_key(text)
+        if key not in tasks:
+            tasks[key] = asyncio.create_task(extract_one(len(tasks) + 1, country, text))
+            # Let the new task send its request while the next chunk is read
+            await asyncio.sleep(0)
+        countries.append(country)
+        keys.append(key)
+
+    if len(tasks) < len(countries):
+        print(f"🔁 {len(countries) - len(tasks)} duplicate chunks will reuse earlier results")
+    await asyncio.gather(*tasks.values())
+
+    results = []
+    seen = set()
+    for country, key in zip(countries, keys):
+        result = tasks[key].result()
+        if key in seen:
+            result = rename(result, country)
+        seen.add(key)
+        results.append(result)
+    return results
+
+# === Save count rows to Parquet sorted by country then year (export to Excel separately) ===
+def save_results(rows, out, columns=None):
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    df = pd.DataFrame(rows)
+    df = df.iloc[np.lexsort((df["year"].to_numpy(), df["country"].to_numpy()))]
+    if columns:
+        df = df.reindex(columns=columns)
+    df.to_parquet(out, index=False, engine="pyarrow", compression="zstd")
+    print(f"✅ Parquet saved to {out}")
+    return df
@@ -1,21 +1,19 @@
 import os
-import re
 import json
+import asyncio
 import pandas as pd
-from typing import List, Dict, Any, Optional
-from dataclasses import dataclass, asdict
-from dotenv import load_dotenv, find_dotenv
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple, Callable
+from itertools import chain, repeat
+from dataclasses import dataclass, asdict, replace
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
 import openai
-from agentic_doc.parse import parse
+from pydantic import BaseModel
 
-# Load environment variables
-load_dotenv(find_dotenv())
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY is not set. Please set it in your .env file.")
-
-# Initialize OpenAI client
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+from llm_cache import llm_cache, cached_llm
+from utils import iter_clean_lines, iter_country_chunks, prune_country_text, has_delegation_content, export_to_excel
+from delegates_core import (MAX_CONCURRENT_REQUESTS, split_request_budget, get_client, get_year_from_filename, extract_text_from_pdf,
+                            extract_sessions_async, save_results)
 
 @dataclass
 class DelegationInfo:
@@ -31,73 +29,127 @@ class DelegationInfo:
     def to_dict(self) -> Dict[str, Any]:
         return asdict(self)\
 
+class DelegationRecord(BaseModel):
+    """Structured-output schema mirroring DelegationInfo (all fields required for strict mode)"""
+    country: str
+    year: str
+    officials: List[str]
+    representatives: List[str]
+    alternate_representatives: List[str]
+    advisers: List[str]
+    leader_present: bool
+    leader_name: Optional[str]
+
+class CountrySegment(BaseModel):
+    country: str
+    raw_text: str
+
+class CountrySegments(BaseModel):
+    countries: List[CountrySegment]
+
 class OpenAIDelegateExtractor:
-    def __init__(self):
-        self.client = client
-        
-    def load_text_from_debug_file(self, year: str) -> str:
-        """Load text from debug_raw_text_*.txt files"""
-        debug_filename = f"debug_raw_text_{year}.txt"
-        debug_path = os.path.join("txt", debug_filename)
+    def __init__(self, max_concurrent_requests: int = MAX_CONCURRENT_REQUESTS):
+        self.max_concurrent_requests = max_concurrent_requests
+        self._loop = None
+        self._client = None
+        self._semaphore = None
+    
+    def _bind_to_running_loop(self):
+        """Create the pooled async client and request semaphore for the current event loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._client = get_client()
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+    
+    async def aclose(self):
+        """Close the pooled client so its connections are released before the event loop ends"""
+        if self._client is not None:
+            await self._client.close()
+        self._loop = self._client = self._semaphore = None
+    
+    def run(self, coro):
+        """Run a coroutine on a fresh event loop, closing the pooled client afterwards"""
+        async def run_and_close():
+            try:
+                return await coro
+            finally:
+                await self.aclose()
+        return asyncio.run(run_and_close())
+    
+    @property
+    def client(self) -> openai.AsyncOpenAI:
+        self._bind_to_running_loop()
+        return self._client
+    
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        self._bind_to_running_loop()
+        return self._semaphore
+        
+    @cached_llm(llm_cache)
+    async def _parse_completion(self, **request) -> Dict[str, Any]:
+        """Call OpenAI with a pydantic response_format and return the parsed object as a dict (cached on disk)"""
+        async with self.semaphore:
+            response = await self.client.beta.chat.completions.parse(**request)
+        message = response.choices[0].message
+        if message.parsed is None:
+            raise ValueError(f"OpenAI refused the request: {message.refusal}")
+        return message.parsed.model_dump()
+    
+    def _debug_file_path(self, year: str) -> str:
+        return os.path.join("txt", f"debug_raw_text_{year}.txt")
+    
+    def load_text_from_debug_file(self, year: str) -> Iterator[str]:
+        """Stream stripped, non-empty lines from debug_raw_text_*.txt files"""
+        debug_path = self._debug_file_path(year)
         
         if os.path.exists(debug_path):
             print(f"Loading text from {debug_path}")
             try:
                 with open(debug_path, 'r', encoding='utf-8') as f:
-                    return f.read()
+                    for line in f:
+                        line = line.strip()
+                        if line:
+                            yield line
             except Exception as e:
                 print(f"Error reading debug text file: {e}")
-                return ""
         else:
             print(f"Debug file {debug_path} not found")
-            return ""
     
-    def extract_text_from_pdf(self, pdf_path: str) -> str:
-        """Extract text from PDF using agentic_doc, or load from cache if available"""
-        # Create cache directory
-        cache_dir = "text_cache"
-        os.makedirs(cache_dir, exist_ok=True)
-        
-        # Generate cache filename
-        pdf_filename = os.path.basename(pdf_path)
-        cache_filename = os.path.splitext(pdf_filename)[0] + ".txt"
-        cache_path = os.path.join(cache_dir, cache_filename)
-        
-        # Check if cached text exists
-        if os.path.exists(cache_path):
-            print(f"Loading cached text from {cache_path}")
-            try:
-                with open(cache_path, 'r', encoding='utf-8') as f:
-                    return f.read()
-            except Exception as e:
-                print(f"Error reading cached text: {e}")
-                # Fall through to extract from PDF
-        
-        # Extract text from PDF
+    def _read_debug_file(self, year: str) -> str:
+        """Read a whole debug_raw_text_*.txt file (only needed for the OpenAI segmentation fallback)"""
+        debug_path = self._debug_file_path(year)
+        if not os.path.exists(debug_path):
+            return ""
         try:
-            print(f"Extracting text from {pdf_path}...")
-            results = parse(pdf_path)
-            full_text = ""
-            for res in results:
-                if hasattr(res, 'markdown'):
-                    full_text += "\n" + res.markdown
-                elif hasattr(res, 'text'):
-                    full_text += "\n" + res.text
-            
-            # Save to cache
-            try:
-                with open(cache_path, 'w', encoding='utf-8') as f:
-                    f.write(full_text)
-                print(f"Text cached to {cache_path}")
-            except Exception as e:
-                print(f"Error saving text to cache: {e}")
-            
-            return full_text
+            with open(debug_path, 'r', encoding='utf-8') as f:
+                return f.read()
         except Exception as e:
-            print(f"Error extracting text from {pdf_path}: {e}")
+            print(f"Error reading debug text file: {e}")
             return ""
     
-    def clean_and_segment_text(self, text: str) -> List[Dict[str, str]]:
+    def extract_text_from_pdf(self, pdf_path: str) -> str:
+        """Extract text from PDF using agentic_doc, or load from the shared text cache"""
+        return extract_text_from_pdf(pdf_path)
+    
+    async def clean_and_segment_text(self, lines: Iterable[str], read_full_text: Callable[[], str]) -> Iterator[Tuple[str, str]]:
+        """Stream (country, raw_text) chunks split locally from lines, falling back to OpenAI for noisy OCR"""
+        chunks = iter_country_chunks(lines)
+        # Any local heading means the split is usable; OpenAI only handles text where none were found
+        first = next(chunks, None)
+        if first is not None:
+            return chain([first], chunks)
+        
+        text = read_full_text()
+        if not text.strip():
+            return iter(())
+        
+        print("No country headings found locally, falling back to OpenAI segmentation")
+        countries_data = await self._segment_text_with_openai(text)
+        return ((d.get('country', f'Unknown_{i}'), d.get('raw_text', '')) for i, d in enumerate(countries_data))
+    
+    async def _segment_text_with_openai(self, text: str) -> List[Dict[str, str]]:
         """Clean text and segment by countries using OpenAI's intelligence"""
         
         # First, let OpenAI clean and identify country sections
@@ -109,7 +161,7 @@ class OpenAIDelegateExtractor:
         1. Identify all country names (they are typically in ALL CAPS)
         2. Extract the delegation information for each country
         3. Ignore image descriptions, page numbers, and other non-delegation content
-        4. Return the result as a JSON array where each object has:
+        4. Return the result as a JSON object with a "countries" array where each object has:
            - "country": the country name (cleaned)
            - "raw_text": the delegation text for that country
         
@@ -120,33 +172,27 @@ class OpenAIDelegateExtractor:
         """
         
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
+            # Heading detection is easy, so the cheaper model is enough here
+            parsed = await self._parse_completion(
+                model="gpt-4o-mini",
                 max_tokens=4000,
                 temperature=0,
+                response_format=CountrySegments,
                 messages=[{"role": "user", "content": cleanup_prompt}]
             )
             
-            # Extract JSON from OpenAI's response
-            response_text = response.choices[0].message.content
-            
-            # Find JSON in the response
-            json_match = re.search(r'\[.*\]', response_text, re.DOTALL)
-            if json_match:
-                countries_data = json.loads(json_match.group())
-                return countries_data
-            else:
-                print("No JSON found in OpenAI's response")
-                return []
+            countries_data = parsed["countries"]
+            if not countries_data:
+                print("No countries found in OpenAI's response")
+            return countries_data
                 
         except Exception as e:
             print(f"Error in text cleanup: {e}")
             return []
     
-    def extract_delegation_info(self, country: str, country_text: str, year: str) -> DelegationInfo:
-        """Extract structured delegation information using OpenAI"""
-        
-        extraction_prompt = f"""
+    def _extraction_prompt(self, country: str, country_text: str, year: str) -> str:
+        """Build the per-country extraction prompt"""
+        return f"""
         Extract delegation information for {country} from the following text.
         
         Please identify and categorize all people into these groups:
@@ -190,27 +236,24 @@ class OpenAIDelegateExtractor:
         
         Return only valid JSON.
         """
-        
+    
+    async def extract_delegation_info(self, country: str, country_text: str, year: str) -> DelegationInfo:
+        """Extract structured delegation information using OpenAI"""
+        if not has_delegation_content(country_text):
+            print(f"    ⏭️ Skipping {country}: no delegation names found")
+            return self._create_empty_delegation(country, year)
         print(f"    🤖 Calling OpenAI API for {country}...")
         try:
-            response = self.client.chat.completions.create(
+            extraction_prompt = self._extraction_prompt(country, prune_country_text(country_text), year)
+            data = await self._parse_completion(
                 model="gpt-4o",
                 max_tokens=2000,
                 temperature=0,
+                response_format=DelegationRecord,
                 messages=[{"role": "user", "content": extraction_prompt}]
             )
             print(f"    ✅ OpenAI API response received for {country}")
-            
-            response_text = response.choices[0].message.content
-            
-            # Extract JSON from response
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                data = json.loads(json_match.group())
-                return DelegationInfo(**data)
-            else:
-                print(f"No JSON found in response for {country}")
-                return self._create_empty_delegation(country, year)
+            return DelegationInfo(**data)
                 
         except Exception as e:
             print(f"Error extracting delegation info for {country}: {e}")
@@ -229,40 +272,36 @@ class OpenAIDelegateExtractor:
             leader_name=None
         )
     
-    def process_single_year(self, year: str) -> List[DelegationInfo]:
+    async def extract_countries(self, chunks: Iterable[Tuple[str, str]], year: str) -> List[DelegationInfo]:
+        """Schedule extraction for each chunk as it arrives, calling OpenAI once per distinct text"""
+        
+        async def extract_one(n: int, country: str, raw_text: str) -> DelegationInfo:
+            print(f"  🇺🇳 Processing country {n}: {country}")
+            delegation = await self.extract_delegation_info(country, raw_text, year)
+            print(f"    ✅ {country} processed - {delegation.officials.__len__() + delegation.representatives.__len__() + delegation.alternate_representatives.__len__() + delegation.advisers.__len__()} total attendees")
+            return delegation
+        
+        # Duplicate texts reuse the result under their own country name
+        return await extract_sessions_async(chunks, extract_one, lambda delegation, country: replace(delegation, country=country))
+    
+    async def process_single_year(self, year: str) -> List[DelegationInfo]:
         """Process a single year using debug_raw_text_*.txt files"""
         debug_filename = f"debug_raw_text_{year}.txt"
         print(f"Processing {debug_filename}...")
         
         print(f"📅 YEAR: {year}")
         
-        # Load text from debug file
-        text = self.load_text_from_debug_file(year)
-        if not text:
-            print(f"No text loaded from {debug_filename}")
-            return []
-        
-        # Clean and segment by countries
-        countries_data = self.clean_and_segment_text(text)
-        if not countries_data:
-            print(f"No countries found in {debug_filename}")
-            return []
+        # Stream lines from the debug file and segment them by country as they are read
+        lines = self.load_text_from_debug_file(year)
+        chunks = await self.clean_and_segment_text(lines, lambda: self._read_debug_file(year))
         
         # Extract delegation info for each country
-        delegations = []
-        print(f"🌍 Found {len(countries_data)} countries to process:")
-        for i, country_data in enumerate(countries_data):
-            country = country_data.get('country', f'Unknown_{i}')
-            country_text = country_data.get('raw_text', '')
-            
-            print(f"  🇺🇳 Processing country {i+1}/{len(countries_data)}: {country}")
-            delegation = self.extract_delegation_info(country, country_text, year)
-            delegations.append(delegation)
-            print(f"    ✅ {country} processed - {delegation.officials.__len__() + delegation.representatives.__len__() + delegation.alternate_representatives.__len__() + delegation.advisers.__len__()} total attendees")
-        
+        delegations = await self.extract_countries(chunks, year)
+        if not delegations:
+            print(f"No countries found in {debug_filename}")
         return delegations
 
-    def process_single_pdf(self, pdf_path: str) -> List[DelegationInfo]:
+    async def process_single_pdf(self, pdf_path: str) -> List[DelegationInfo]:
         """Process a single PDF file"""
         print(f"Processing {pdf_path}...")
         
@@ -277,30 +316,17 @@ class OpenAIDelegateExtractor:
             return []
         
         # Clean and segment by countries
-        countries_data = self.clean_and_segment_text(text)
-        if not countries_data:
-            print(f"No countries found in {pdf_path}")
-            return []
+        chunks = await self.clean_and_segment_text(iter_clean_lines(text), lambda: text)
         
         # Extract delegation info for each country
-        delegations = []
-        print(f"🌍 Found {len(countries_data)} countries to process:")
-        for i, country_data in enumerate(countries_data):
-            country = country_data.get('country', f'Unknown_{i}')
-            country_text = country_data.get('raw_text', '')
-            
-            print(f"  🇺🇳 Processing country {i+1}/{len(countries_data)}: {country}")
-            delegation = self.extract_delegation_info(country, country_text, year)
-            delegations.append(delegation)
-            print(f"    ✅ {country} processed - {delegation.officials.__len__() + delegation.representatives.__len__() + delegation.alternate_representatives.__len__() + delegation.advisers.__len__()} total attendees")
-        
+        delegations = await self.extract_countries(chunks, year)
+        if not delegations:
+            print(f"No countries found in {pdf_path}")
         return delegations
     
     def _extract_year_from_filename(self, filepath: str) -> str:
         """Extract year from filename"""
-        filename = os.path.basename(filepath)
-        match = re.search(r'(\d{4})', filename)
-        return match.group(1) if match else "Unknown"
+        return get_year_from_filename(filepath, default="Unknown")
     
     def process_pdf_folder(self, folder_path: str) -> List[DelegationInfo]:
         """Process all PDFs in a folder"""
@@ -313,15 +339,15 @@ class OpenAIDelegateExtractor:
         
         print(f"Found {len(pdf_files)} PDF files in {folder_path}")
         
+        # PDFs are independent, so parse + extract each one in its own process
+        pdf_paths = [os.path.join(folder_path, pdf_file) for pdf_file in pdf_files]
         all_delegations = []
-        for i, pdf_file in enumerate(pdf_files):
-            print(f"\n{'='*50}")
-            print(f"📄 Processing PDF {i+1}/{len(pdf_files)}: {pdf_file}")
-            print(f"{'='*50}")
-            pdf_path = os.path.join(folder_path, pdf_file)
-            delegations = self.process_single_pdf(pdf_path)
-            all_delegations.extend(delegations)
-            print(f"✅ PDF {pdf_file} complete: {len(delegations)} countries processed")
+        # Each worker gets its share of the OpenAI request budget
+        workers, per_worker = split_request_budget(len(pdf_paths))
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            for i, (pdf_file, delegations) in enumerate(zip(pdf_files, ex.map(process_one_pdf, pdf_paths, repeat(per_worker)))):
+                all_delegations.extend(delegations)
+                print(f"✅ PDF {i+1}/{len(pdf_files)} {pdf_file} complete: {len(delegations)} countries processed")
         
         return all_delegations
     
@@ -335,29 +361,13 @@ class OpenAIDelegateExtractor:
         print(f"⏰ Started at: {time.strftime('%H:%M:%S')}")
         print("=" * 70)
         
+        # Years are independent and HTTP-bound, so run them all on one event loop
+        delegations_by_year = self.run(self._process_years(years))
+        
+        # Keep the output in year order regardless of completion order
         all_delegations = []
-        for i, year in enumerate(years):
-            year_start = time.time()
-            progress_percent = ((i) / len(years)) * 100
-            
-            print(f"\n📅 YEAR {i+1}/{len(years)}: {year} | Progress: {progress_percent:.1f}%")
-            print(f"⏱️  Elapsed: {time.time() - start_time:.0f}s | Year started: {time.strftime('%H:%M:%S')}")
-            
-            delegations = self.process_single_year(str(year))
-            all_delegations.extend(delegations)
-            
-            year_time = time.time() - year_start
-            total_delegates = sum(len(d.officials) + len(d.representatives) + len(d.alternate_representatives) + len(d.advisers) for d in delegations)
-            
-            print(f"✅ Year {year}: {len(delegations)} countries, {total_delegates} total delegates ({year_time:.1f}s)")
-            print(f"📊 Total so far: {len(all_delegations)} countries processed")
-            
-            if i < len(years) - 1:
-                remaining = len(years) - i - 1
-                avg_time = (time.time() - start_time) / (i + 1)
-                eta_seconds = remaining * avg_time
-                eta_time = time.strftime('%H:%M:%S', time.localtime(time.time() + eta_seconds))
-                print(f"⏳ ETA for completion: {eta_time} (approx {eta_seconds/60:.1f} min remaining)")
+        for year in years:
+            all_delegations.extend(delegations_by_year[year])
         
         total_time = time.time() - start_time
         print(f"\n🎉 BULK PROCESSING COMPLETE!")
@@ -366,20 +376,32 @@ class OpenAIDelegateExtractor:
         
         return all_delegations
     
-    def save_to_excel(self, delegations: List[DelegationInfo], output_path: str = None):
-        """Save delegation data to Excel"""
+    async def _process_years(self, years: List[int]) -> Dict[int, List[DelegationInfo]]:
+        """Process years concurrently, sharing one pooled client and request semaphore"""
+        delegations_by_year = {}
+        
+        async def process_year(year: int):
+            delegations = await self.process_single_year(str(year))
+            delegations_by_year[year] = delegations
+            total_delegates = sum(len(d.officials) + len(d.representatives) + len(d.alternate_representatives) + len(d.advisers) for d in delegations)
+            tqdm.write(f"✅ Year {year}: {len(delegations)} countries, {total_delegates} total delegates")
+            progress.update(1)
+        
+        with tqdm(total=len(years), desc="Years", unit="year") as progress:
+            await asyncio.gather(*(process_year(year) for year in years))
+        
+        return delegations_by_year
+    
+    def save_to_parquet(self, delegations: List[DelegationInfo], output_path: str = None):
+        """Save delegation data to Parquet (use export_to_excel for a spreadsheet)"""
         if not delegations:
             print("No delegations to save")
             return
         
-        # Create output directory
-        output_dir = "excel_outputs"
-        os.makedirs(output_dir, exist_ok=True)
-        
         if not output_path:
             years = [d.year for d in delegations if d.year != "Unknown"]
             year_range = f"{min(years)}-{max(years)}" if years else "Unknown"
-            output_path = os.path.join(output_dir, f"openai_delegation_counts_{year_range}.xlsx")
+            output_path = os.path.join("excel_outputs", f"openai_delegation_counts_{year_range}.parquet")
         
         # Convert to DataFrame
         rows = []
@@ -406,11 +428,8 @@ class OpenAIDelegateExtractor:
         
         # Standardize country names to title case
         df['country'] = df['country'].str.title().str.strip()
-        df = df.sort_values(["country", "year"], na_position='last')
-        
-        # Save to Excel
-        df.to_excel(output_path, index=False)
-        print(f"Results saved to {output_path}")
+        # Sorted by country then year (NaN years last) and saved to Parquet
+        df = save_results(df, output_path)
         
         # Print summary
         print(f"\nSummary:")
@@ -444,6 +463,11 @@ class OpenAIDelegateExtractor:
         print(f"Detailed data saved to {output_path}")
         return output_path
 
+def process_one_pdf(pdf_path: str, max_concurrent_requests: int = MAX_CONCURRENT_REQUESTS) -> List[DelegationInfo]:
+    """Process a single PDF in a worker process"""
+    extractor = OpenAIDelegateExtractor(max_concurrent_requests)
+    return extractor.run(extractor.process_single_pdf(pdf_path))
+
 def main():
     """Main function to process existing text files"""
     extractor = OpenAIDelegateExtractor()
@@ -453,7 +477,8 @@ def main():
     
     if delegations:
         # Save results
-        extractor.save_to_excel(delegations)
+        parquet_path = extractor.save_to_parquet(delegations)
+        export_to_excel(parquet_path)
         extractor.save_detailed_json(delegations)
     else:
         print("No delegations extracted")
@@ -0,0 +1,55 @@
+import os
+import json
+import hashlib
+import inspect
+import functools
+import diskcache
+
+# === Persistent on-disk cache for deterministic (temperature=0) LLM calls ===
+# Next to the scripts, so every entry point shares it regardless of the working directory
+LLM_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_cache")
+llm_cache = diskcache.Cache(LLM_CACHE_DIR)
+
+_MISS = object()
+
+def _json_default(obj):
+    # pydantic response_format classes are keyed by their JSON schema
+    if isinstance(obj, type) and hasattr(obj, "model_json_schema"):
+        return obj.model_json_schema()
+    return str(obj)
+
+def cache_key(request: dict) -> str:
+    """SHA-256 of the canonicalized JSON request (model, messages, temperature, functions...)"""
+    canonical = json.dumps(request, sort_keys=True, ensure_ascii=False, default=_json_default)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def cached_llm(cache):
+    """Cache a sync or async LLM call, keyed on its keyword arguments.
+
+    Positional arguments (e.g. ``self``) are passed through but not hashed, so
+    everything that affects the response must be given as a keyword argument.
+    """
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **request):
+                key = cache_key(request)
+                value = cache.get(key, default=_MISS)
+                if value is not _MISS:
+                    return value
+                value = await func(*args, **request)
+                cache.set(key, value)
+                return value
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **request):
+            key = cache_key(request)
+            value = cache.get(key, default=_MISS)
+            if value is not _MISS:
+                return value
+            value = func(*args, **request)
+            cache.set(key, value)
+            return value
+        return wrapper
+    return decorator
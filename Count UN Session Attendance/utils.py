@@ -0,0 +1,116 @@
+import os
+import re
+import string
+import hashlib
+import functools
+import httpx
+import pandas as pd
+import tiktoken
+
+# Country headings: an uppercase ASCII letter followed only by these characters
+_HEADING_FIRST_CHARS = frozenset(string.ascii_uppercase)
+_HEADING_CHARS = frozenset(string.ascii_uppercase + string.whitespace + "-&,'.")
+_WHITESPACE_RE = re.compile(r'\s+')
+_PAGE_NUMBER_RE = re.compile(r'^\s*\d+\s*$')
+_PERSON_NAME_RE = re.compile(r'[A-Z][a-z]+ [A-Z]')
+# Runs of characters between the same line boundaries str.splitlines() uses
+_LINE_RE = re.compile('[^\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]+')
+
+# === Stream stripped, non-empty lines without materializing a list ===
+def iter_clean_lines(text):
+    for m in _LINE_RE.finditer(text):
+        line = m.group().strip()
+        if line:
+            yield line
+
+# === Yield (country, text) chunks from stripped lines as soon as the next heading is seen ===
+def iter_country_chunks(lines):
+    current_country = None
+    current_text_lines = []
+
+    for line in lines:
+        line_clean = line
+        if '<!--' in line:
+            line_clean = line.partition('<!--')[0].strip()
+
+        # isupper() rejects almost every body line before the per-character check runs
+        # Unicode whitespace (e.g. NBSP from OCR) counts too, as it did with the old \s regex
+        if (line_clean.isupper() and line_clean[0] in _HEADING_FIRST_CHARS
+                and (_HEADING_CHARS.issuperset(line_clean)
+                     or all(c in _HEADING_CHARS or c.isspace() for c in line_clean))):
+            print(f"Detected country heading: {line_clean}")  # <-- debug here
+            if current_country:
+                yield current_country, "\n".join(current_text_lines)
+            current_country = line_clean
+            current_text_lines = []
+        else:
+            current_text_lines.append(line)
+
+    if current_country and current_text_lines:
+        yield current_country, "\n".join(current_text_lines)
+
+# === Split text by country headings (robust to trailing HTML comments) ===
+def split_text_by_country(text):
+    return list(iter_country_chunks(iter_clean_lines(text)))
+
+# === Hash of a text with whitespace normalized, used to spot duplicate chunks ===
+def text_key(text):
+    normalized = _WHITESPACE_RE.sub(' ', text).strip()
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+# === Skip the LLM for OCR stubs: too short or no "Firstname L..." style name ===
+MIN_CHUNK_CHARS = 40
+
+def has_delegation_content(text):
+    return len(text.strip()) >= MIN_CHUNK_CHARS and _PERSON_NAME_RE.search(text) is not None
+
+# === Prompt budget for one country's text ===
+MAX_LINE_CHARS = 300
+MAX_COUNTRY_TOKENS = 6000
+
+@functools.lru_cache(maxsize=None)
+def _token_encoding(model="gpt-4o"):
+    return tiktoken.encoding_for_model(model)
+
+# === Drop page numbers / blank runs, clip long lines and cap the token count ===
+def prune_country_text(text, max_tokens=MAX_COUNTRY_TOKENS):
+    lines = []
+    previous_blank = False
+    for line in text.splitlines():
+        if _PAGE_NUMBER_RE.match(line):
+            continue
+        blank = not line.strip()
+        if blank and previous_blank:
+            continue
+        previous_blank = blank
+        lines.append(line[:MAX_LINE_CHARS])
+    pruned = "\n".join(lines)
+
+    # Names cluster at the top of a country block, so keep the head and the tail
+    encoding = _token_encoding()
+    # OCR text may contain strings like "<|endoftext|>"; encode them as plain text instead of raising
+    tokens = encoding.encode(pruned, disallowed_special=())
+    if len(tokens) > max_tokens:
+        half = max_tokens // 2
+        pruned = encoding.decode(tokens[:half]) + "\n...\n" + encoding.decode(tokens[-half:])
+    return pruned
+
+# === Pooled HTTP/2 client so concurrent OpenAI requests reuse TLS connections ===
+HTTP_MAX_CONNECTIONS = 50
+
+def create_async_http_client():
+    return httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS),
+        # Same timeouts as the OpenAI SDK's default client (httpx's 5s default is too short)
+        timeout=httpx.Timeout(600.0, connect=5.0),
+    )
+
+# === Convert a Parquet results file to .xlsx once, when a spreadsheet is needed ===
+def export_to_excel(parquet_path, excel_path=None):
+    if not excel_path:
+        excel_path = os.path.splitext(parquet_path)[0] + ".xlsx"
+    df = pd.read_parquet(parquet_path)
+    df.to_excel(excel_path, index=False, engine="xlsxwriter")
+    print(f"✅ Excel exported to {excel_path}")
+    return excel_path
@@ -3,39 +3,51 @@ import os
 import re
 import numpy as np
 
-def clean_numeric(x):
-    if pd.isna(x):
-        return np.nan
-    try:
-        s = str(x)
-        # Keep only digits, dot, minus sign
-        s_clean = re.sub(r'[^0-9\.-]', '', s)
-        if s_clean == '' or s_clean == '.' or s_clean == '-':
-            return np.nan
-        return float(s_clean)
-    except:
-        return np.nan
-
-def process_file(filepath):
+_NUMERIC_STRIP_RE = re.compile(r'[^0-9\.-]')
+_YEAR_RE = re.compile(r'(\d{4})')
+
+# Arrow-backed dtypes for the merged table: contiguous UTF-8 strings and validity bitmaps instead of PyObjects
+MERGED_DTYPES = {
+    'year': 'int64[pyarrow]',
+    'country': 'string[pyarrow]',
+    'annual_contributions': 'float64[pyarrow]',
+    'total_outstanding_contributions': 'float64[pyarrow]',
+    'assessed_contributions': 'float64[pyarrow]',
+}
+
+def clean_numeric_column(s: pd.Series) -> pd.Series:
+    # Keep only digits, dot, minus sign; leftovers with no digits become NaN
+    s_clean = s.astype(str).str.replace(_NUMERIC_STRIP_RE, '', regex=True)
+    s_clean = s_clean.mask(s_clean.isin(['', '.', '-']))
+    return pd.to_numeric(s_clean, errors='coerce')
+
+def concat_columns(frames):
+    # Every frame has the same columns, so join each column's numpy array instead of aligning whole frames
+    columns = frames[0].columns
+    merged = pd.DataFrame({col: np.concatenate([df[col].to_numpy() for df in frames]) for col in columns})
+    return merged.astype(MERGED_DTYPES)
+
+def read_file_tables(filepath):
+    """Return one DataFrame per usable sheet, leaving the concatenation to the caller"""
     print(f"\nProcessing file: {filepath}")
-    year_match = re.search(r'(\d{4})', filepath)
+    year_match = _YEAR_RE.search(filepath)
     year = int(year_match.group(1)) if year_match else None
     if not year or not (2000 <= year <= 2016):
         print(f"Skipping {filepath}: invalid year")
-        return pd.DataFrame()
+        return []
 
+    # All sheets are read in one pass with the Rust-based calamine engine
     try:
-        xls = pd.ExcelFile(filepath)
+        skip = 1 if year <= 2010 else 0
+        sheets = pd.read_excel(filepath, sheet_name=None, skiprows=skip, dtype=str, engine='calamine')
     except Exception as e:
         print(f"Could not open {filepath}: {e}")
-        return pd.DataFrame()
+        return []
 
     tables = []
-    for sheet in xls.sheet_names:
+    for sheet, df in sheets.items():
         print(f" Reading sheet: {sheet}")
         try:
-            skip = 1 if year <= 2010 else 0
-            df = xls.parse(sheet_name=sheet, skiprows=skip, dtype=str)
 
             print(f"  Sheet shape: {df.shape}")
             if df.empty or df.shape[1] < 3:
@@ -48,19 +60,17 @@ def process_file(filepath):
             print("  Sample countries:", country.head(10).tolist())
 
             if year <= 2010:
-                annual = df.iloc[:, 5].apply(clean_numeric) if df.shape[1] > 5 else pd.Series(np.nan, index=df.index)
-                outstanding = df.iloc[:, 8].apply(clean_numeric) if df.shape[1] > 8 else pd.Series(np.nan, index=df.index)
-
-                both_present = (~annual.isna()) & (~outstanding.isna())
-                assessed = pd.Series(np.nan, index=annual.index)
-                assessed[both_present] = annual[both_present] + outstanding[both_present]
+                annual = clean_numeric_column(df.iloc[:, 5]) if df.shape[1] > 5 else pd.Series(np.nan, index=df.index)
+                outstanding = clean_numeric_column(df.iloc[:, 8]) if df.shape[1] > 8 else pd.Series(np.nan, index=df.index)
+                # NaN in either column propagates, so assessed is only set when both are present
+                assessed = annual + outstanding
 
             elif 2011 <= year <= 2015:
-                assessed = df.iloc[:, 4].apply(clean_numeric) if df.shape[1] > 4 else pd.Series(np.nan, index=df.index)
+                assessed = clean_numeric_column(df.iloc[:, 4]) if df.shape[1] > 4 else pd.Series(np.nan, index=df.index)
                 annual = outstanding = pd.Series(np.nan, index=df.index)
 
             elif year == 2016:
-                assessed = df.iloc[:, 7].apply(clean_numeric) if df.shape[1] > 7 else pd.Series(np.nan, index=df.index)
+                assessed = clean_numeric_column(df.iloc[:, 7]) if df.shape[1] > 7 else pd.Series(np.nan, index=df.index)
                 annual = outstanding = pd.Series(np.nan, index=df.index)
 
             else:
@@ -85,21 +95,24 @@ def process_file(filepath):
             print(f"  Error in {filepath}, sheet '{sheet}': {e}")
             continue
 
-    if tables:
-        return pd.concat(tables, ignore_index=True)
-    else:
+    if not tables:
         print(f"  No valid data found in {filepath}")
-        return pd.DataFrame()
+    return tables
+
+def process_file(filepath):
+    tables = read_file_tables(filepath)
+    return concat_columns(tables) if tables else pd.DataFrame()
 
 def merge_all(folder_path):
+    # Collect every sheet of every file and concatenate once at the end
     all_data = []
-    for file in sorted(os.listdir(folder_path)):
-        if file.endswith('.xlsx') and not file.startswith('~$'):
-            df = process_file(os.path.join(folder_path, file))
-            if not df.empty:
-                all_data.append(df)
+    with os.scandir(folder_path) as entries:
+        files = sorted(entry.path for entry in entries
+                       if entry.name.endswith('.xlsx') and not entry.name.startswith('~$') and entry.is_file())
+    for path in files:
+        all_data.extend(read_file_tables(path))
     if all_data:
-        return pd.concat(all_data, ignore_index=True)
+        return concat_columns(all_data)
     else:
         print("No data merged from any files.")
         return pd.DataFrame()
@@ -112,12 +125,15 @@ if __name__ == "__main__":
         merged = merged[['country', 'year', 'annual_contributions',
                          'total_outstanding_contributions', 'assessed_contributions']]
         # Remove rows where country contains 'total' (case-insensitive)
-        merged = merged[~merged['country'].str.lower().str.contains('total')]
+        is_total = merged['country'].str.contains('total', case=False, na=False, regex=False)
+        merged = merged.loc[~is_total]
 
         print(f"\nFinal merged data sample:")
         print(merged.head(10))
-        merged.to_excel('contributions_2000-2016.xlsx', index=False)
-        print("\nSaved merged data to contributions_2000-2016.xlsx")
+        # Parquet is the fast columnar copy; the .xlsx is kept for fill_contributions.py and spreadsheet users
+        merged.to_parquet('contributions_2000-2016.parquet', index=False, engine='pyarrow', compression='zstd')
+        merged.to_excel('contributions_2000-2016.xlsx', index=False, engine='xlsxwriter')
+        print("\nSaved merged data to contributions_2000-2016.parquet and contributions_2000-2016.xlsx")
     else:
         print("No data merged.")
 
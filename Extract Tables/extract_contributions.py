@@ -11,79 +11,105 @@ parser. Extracted tables are saved in Excel format, one Excel file per year.
 """
 
 from agentic_doc.parse import parse
-import json
+import orjson
+import hashlib
+import numpy as np
 import pandas as pd
 from pathlib import Path
 import re
 from typing import List, Dict, Optional
 from bs4 import BeautifulSoup
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 import os
 
+_TABLE_RE = re.compile(r'<table[^>]*>.*?</table>', re.DOTALL | re.IGNORECASE)
+_YEAR_RE = re.compile(r'(\d{4})')
+
+class _NumericKeepTable(dict):
+    """str.translate table that deletes everything but decimal digits, '.' and '-' (memoized per character)"""
+    def __missing__(self, codepoint: int) -> Optional[int]:
+        char = chr(codepoint)
+        self[codepoint] = codepoint if char.isdecimal() or char in '.-' else None
+        return self[codepoint]
+
+_NUMERIC_KEEP = _NumericKeepTable()
+
 def clean_numeric_value(value: str) -> str:
     if pd.isna(value):
         return ''
-    s = str(value).strip()
-    s = s.replace(',', '').replace(' ', '')
-    s = re.sub(r'[^\d\.-]', '', s)
-    if not re.search(r'\d', s):
+    # Numbers are already clean (bools are not: str(True) has no digits)
+    if isinstance(value, (int, np.integer)) and not isinstance(value, bool):
+        return str(value)
+    if isinstance(value, (float, np.floating)):
+        return str(value) if np.isfinite(value) else ''
+    s = str(value).translate(_NUMERIC_KEEP)
+    # Only digits, '.' and '-' remain, so anything left after stripping the signs is a digit
+    if not s.strip('.-'):
         return ''
     return s
 
+def pdf_digest(pdf_path: Path) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(pdf_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
 def save_parse_json(pdf_path: Path, json_output_dir: Path) -> Optional[Path]:
     try:
+        # Parse JSON is stored as {stem}.{content hash}.json, so unchanged PDFs are never parsed twice
+        json_path = json_output_dir / f"{pdf_path.stem}.{pdf_digest(pdf_path)}.json"
+        if json_path.exists():
+            print(f"Using cached parse JSON {json_path}")
+            return json_path
+        
         results = parse(str(pdf_path), result_save_dir=str(json_output_dir))
-        json_path = Path(results[0].result_path)
+        os.replace(results[0].result_path, json_path)
         print(f"Saved parse JSON to {json_path}")
         return json_path
     except Exception as e:
         print(f"Error parsing {pdf_path}: {e}")
         return None
 
+def _row_cells(row) -> List[str]:
+    row_data = []
+    for cell in row.find_all(['th', 'td']):
+        colspan = int(cell.get('colspan', 1))
+        row_data.append(cell.get_text(strip=True))
+        if colspan > 1:
+            row_data.extend([''] * (colspan - 1))
+    return row_data
+
 def extract_tables_from_json(json_file_path: Path) -> List[pd.DataFrame]:
-    with open(json_file_path, 'r', encoding='utf-8') as file:
-        data = json.load(file)
+    # orjson parses the (large) parse result several times faster than the stdlib json module
+    with open(json_file_path, 'rb') as file:
+        data = orjson.loads(file.read())
     
     markdown_content = data.get('markdown', '')
     if not markdown_content:
         print("No 'markdown' key found in JSON file")
         return []
     
-    table_pattern = r'<table[^>]*>.*?</table>'
-    table_matches = re.findall(table_pattern, markdown_content, re.DOTALL | re.IGNORECASE)
+    table_matches = _TABLE_RE.findall(markdown_content)
     
     tables = []
     for i, table_html in enumerate(table_matches):
         try:
-            soup = BeautifulSoup(table_html, 'html.parser')
+            # lxml (libxml2) is several times faster than the pure-Python html.parser
+            soup = BeautifulSoup(table_html, 'lxml')
             table = soup.find('table')
             if table:
                 rows = []
                 thead = table.find('thead')
                 if thead:
-                    for row in thead.find_all('tr'):
-                        row_data = []
-                        for cell in row.find_all(['th', 'td']):
-                            colspan = int(cell.get('colspan', 1))
-                            cell_text = cell.get_text(strip=True)
-                            row_data.append(cell_text)
-                            for _ in range(colspan - 1):
-                                row_data.append('')
-                        rows.append(row_data)
+                    rows.extend(_row_cells(row) for row in thead.find_all('tr'))
                 tbody = table.find('tbody')
                 if tbody:
                     body_rows = tbody.find_all('tr')
                 else:
                     body_rows = [tr for tr in table.find_all('tr') if tr.parent.name != 'thead']
-                for row in body_rows:
-                    row_data = []
-                    for cell in row.find_all(['th', 'td']):
-                        colspan = int(cell.get('colspan', 1))
-                        cell_text = cell.get_text(strip=True)
-                        row_data.append(cell_text)
-                        for _ in range(colspan - 1):
-                            row_data.append('')
-                    rows.append(row_data)
+                rows.extend(_row_cells(row) for row in body_rows)
                 if rows:
                     if len(rows) > 1:
                         df = pd.DataFrame(rows[1:], columns=rows[0])
@@ -98,7 +124,11 @@ def extract_tables_from_json(json_file_path: Path) -> List[pd.DataFrame]:
     return tables
 
 def extract_year_from_filename(filename: str) -> Optional[int]:
-    match = re.search(r'(\d{4})', filename)
+    # Files in docs/ are named YYYY.pdf; only fall back to the regex for other names
+    stem = filename.partition('.')[0]
+    if len(stem) == 4 and stem.isascii() and stem.isdigit():
+        return int(stem)
+    match = _YEAR_RE.search(filename)
     return int(match.group(1)) if match else None
 
 def save_tables_to_excel(tables: List[pd.DataFrame], output_file: str, year: int):
@@ -106,50 +136,59 @@ def save_tables_to_excel(tables: List[pd.DataFrame], output_file: str, year: int
         print("No tables to save")
         return
     
-    with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
+    with pd.ExcelWriter(output_file, engine='xlsxwriter') as writer:
+        workbook = writer.book
+        header_format = workbook.add_format({
+            'bold': True, 'font_color': '#FFFFFF', 'bg_color': '#366092',
+            'align': 'center', 'valign': 'vcenter', 'border': 1
+        })
+        body_format = workbook.add_format({'border': 1})
+        banded_format = workbook.add_format({'border': 1, 'bg_color': '#F2F2F2'})
+        
         for i, df in enumerate(tables):
             sheet_name = f'Table_{i+1}_{year}'
             df.to_excel(writer, sheet_name=sheet_name, index=False)
             
             worksheet = writer.sheets[sheet_name]
             
-            header_fill = PatternFill(start_color='366092', end_color='366092', fill_type='solid')
-            header_font = Font(bold=True, color='FFFFFF')
-            
-            for cell in worksheet[1]:
-                cell.fill = header_fill
-                cell.font = header_font
-                cell.alignment = Alignment(horizontal='center', vertical='center')
+            # Longest rendered value per column (header included), padded and capped at 50
+            cell_lengths = df.fillna('').astype(str).map(len).max().fillna(0).to_numpy()
+            header_lengths = np.array([len(str(column_name)) for column_name in df.columns])
+            widths = np.minimum(np.maximum(cell_lengths, header_lengths) + 2, 50)
             
-            for column in worksheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = min(max_length + 2, 50)
-                worksheet.column_dimensions[column_letter].width = adjusted_width
+            for col_num, column_name in enumerate(df.columns):
+                worksheet.write(0, col_num, column_name, header_format)
+                worksheet.set_column(col_num, col_num, widths[col_num])
             
-            thin_border = Border(
-                left=Side(style='thin'),
-                right=Side(style='thin'),
-                top=Side(style='thin'),
-                bottom=Side(style='thin')
-            )
-            
-            light_fill = PatternFill(start_color='F2F2F2', end_color='F2F2F2', fill_type='solid')
-            
-            for row_num, row in enumerate(worksheet.iter_rows(min_row=1), 1):
-                for cell in row:
-                    cell.border = thin_border
-                    if row_num > 1 and row_num % 2 == 0:
-                        cell.fill = light_fill
+            # Borders and banding are applied by reference to the whole table range, not cell by cell
+            if len(df) and len(df.columns):
+                last_row, last_col = len(df), len(df.columns) - 1
+                worksheet.conditional_format(1, 0, last_row, last_col, {
+                    'type': 'formula', 'criteria': '=MOD(ROW(),2)=0', 'format': banded_format
+                })
+                worksheet.conditional_format(1, 0, last_row, last_col, {
+                    'type': 'formula', 'criteria': '=MOD(ROW(),2)=1', 'format': body_format
+                })
     
     print(f"Tables saved to {output_file}")
 
+def process_one_pdf(pdf_path: Path, json_dir: Path, excel_dir: Path) -> Optional[Path]:
+    year = extract_year_from_filename(pdf_path.name)
+    print(f"\n--- Processing {pdf_path.name} (Year: {year}) ---")
+    
+    json_path = save_parse_json(pdf_path, json_dir)
+    if not json_path:
+        return None
+    
+    tables = extract_tables_from_json(json_path)
+    if not tables:
+        print(f"No tables found in {pdf_path.name}")
+        return None
+    
+    excel_file = excel_dir / f"un_contributions_{year}.xlsx"
+    save_tables_to_excel(tables, str(excel_file), year)
+    return excel_file
+
 def process_all_pdfs():
     docs_dir = Path("docs")
     json_dir = Path("json_outputs")
@@ -162,26 +201,20 @@ def process_all_pdfs():
     
     print(f"Found {len(pdf_files)} PDF files to process")
     
+    in_range = []
     for pdf_path in pdf_files:
         year = extract_year_from_filename(pdf_path.name)
         
         if not year or year < 2000 or year > 2016:
             print(f"Skipping {pdf_path.name} - year {year} not in range 2000-2016")
             continue
-        
-        print(f"\n--- Processing {pdf_path.name} (Year: {year}) ---")
-        
-        json_path = save_parse_json(pdf_path, json_dir)
-        if not json_path:
-            continue
-        
-        tables = extract_tables_from_json(json_path)
-        if not tables:
-            print(f"No tables found in {pdf_path.name}")
-            continue
-        
-        excel_file = excel_dir / f"un_contributions_{year}.xlsx"
-        save_tables_to_excel(tables, str(excel_file), year)
+        in_range.append(pdf_path)
+    
+    # Each PDF is independent: parse, table extraction and Excel writing run in their own process
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+        excel_files = list(ex.map(process_one_pdf, in_range, repeat(json_dir), repeat(excel_dir)))
+    
+    print(f"\nWrote {sum(f is not None for f in excel_files)} of {len(in_range)} Excel files")
         
 def process_single_file_debug(pdf_filename: str = "2000.pdf"):
     docs_dir = Path("docs")
@@ -215,7 +248,7 @@ def process_single_file_debug(pdf_filename: str = "2000.pdf"):
         # New code: Read back the saved Excel file and print first 10 rows of first sheet
         print(f"\nReading first 10 rows from saved debug Excel file: {excel_file}")
         try:
-            df_check = pd.read_excel(excel_file, sheet_name=0)
+            df_check = pd.read_excel(excel_file, sheet_name=0, engine='calamine')
             print(df_check.head(10).to_string(index=False))
         except Exception as e:
             print(f"Error reading debug Excel file: {e}")
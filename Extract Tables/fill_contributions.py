@@ -1,59 +1,72 @@
 import pandas as pd
 import os
 import re
-import unicodedata
 
-def normalize_country(name):
-    if pd.isna(name):
-        return ''
-    name = str(name).lower()
+_NON_LETTER_RE = re.compile(r'[^a-z]')
+
+def normalize_country_series(names: pd.Series) -> pd.Series:
+    names = names.astype('string').fillna('').str.lower()
     # Remove accents: é -> e, ô -> o, etc.
-    name = unicodedata.normalize('NFKD', name).encode('ASCII', 'ignore').decode('utf-8')
+    names = names.str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii')
     # Remove all non-letter characters (keep only a-z)
-    name = re.sub(r'[^a-z]', '', name)
-    return name
+    return names.str.replace(_NON_LETTER_RE, '', regex=True)
+
+CONTRIBUTION_COLUMNS = ['annual_contributions', 'total_outstanding_contributions', 'assessed_contributions']
 
 def append_contributions_to_country_files(country_folder, contributions_file):
-    contributions = pd.read_excel(contributions_file)
+    contributions = pd.read_excel(contributions_file, dtype_backend='pyarrow', engine='calamine')
     contributions['country_original'] = contributions['country']
-    contributions['country_norm'] = contributions['country'].apply(normalize_country)
+    contributions['country_norm'] = normalize_country_series(contributions['country'])
 
-    for filename in os.listdir(country_folder):
-        if not filename.endswith('.xlsx') or filename.startswith('~$'):
-            continue
-        
-        path = os.path.join(country_folder, filename)
-        print(f"\nUpdating: {filename}")
+    # Read every country file first so the merge runs once over all of them
+    frames = []
+    columns_by_file = {}
+    with os.scandir(country_folder) as entries:
+        country_files = [(entry.name, entry.path) for entry in entries
+                         if entry.name.endswith('.xlsx') and not entry.name.startswith('~$') and entry.is_file()]
+
+    for filename, path in country_files:
+        print(f"\nReading: {filename}")
         
         try:
-            df = pd.read_excel(path)
+            # Arrow-backed dtypes keep integer columns intact when other files lack them
+            df = pd.read_excel(path, dtype_backend='pyarrow', engine='calamine')
             df['country_original'] = df['country'].astype(str)
-            df['country_norm'] = df['country_original'].apply(normalize_country)
             df['year'] = df['year'].astype(int)
 
             # Drop existing contribution columns if present
-            cols_to_drop = [col for col in [
-                'annual_contributions', 'total_outstanding_contributions', 'assessed_contributions'
-            ] if col in df.columns]
+            cols_to_drop = [col for col in CONTRIBUTION_COLUMNS if col in df.columns]
             df_cleaned = df.drop(columns=cols_to_drop)
 
-            # Merge on normalized country and year
-            df_merged = df_cleaned.merge(
-                contributions[['country_norm', 'year', 'annual_contributions', 
-                               'total_outstanding_contributions', 'assessed_contributions']],
-                on=['country_norm', 'year'],
-                how='left'
-            )
+            columns_by_file[filename] = [col for col in df_cleaned.columns if col != 'country_original']
+            df_cleaned['_src'] = filename
+            frames.append(df_cleaned)
+        
+        except Exception as e:
+            print(f"  ❌ Failed to read {filename}: {e}")
+
+    if not frames:
+        print("No country files to update")
+        return
+
+    combined = pd.concat(frames, ignore_index=True)
+    combined['country_norm'] = normalize_country_series(combined['country_original'])
 
-            # Drop normalized country column before saving, keep original
-            df_merged.drop(columns=['country_norm'], inplace=True)
+    # Merge on normalized country and year
+    merged = combined.merge(
+        contributions[['country_norm', 'year'] + CONTRIBUTION_COLUMNS],
+        on=['country_norm', 'year'],
+        how='left'
+    )
 
-            # If original country name missing, fill from original contribution data
-            df_merged['country'] = df_merged['country_original']
-            df_merged.drop(columns=['country_original'], inplace=True)
+    # If original country name missing, fill from original contribution data
+    merged['country'] = merged['country_original']
 
-            # Save updated file
-            df_merged.to_excel(path, index=False)
+    for filename, df_merged in merged.groupby('_src', sort=False):
+        path = os.path.join(country_folder, filename)
+        try:
+            # Save updated file with its own columns, followed by the contribution columns
+            df_merged[columns_by_file[filename] + CONTRIBUTION_COLUMNS].to_excel(path, index=False)
             print(f"  ✔ Saved updated file: {filename}")
         
         except Exception as e: